@@ -0,0 +1,5 @@
+"""Point the app at a throwaway database before anything imports it."""
+import os, tempfile
+
+os.environ["ATTENDANCE_DB"] = os.path.join(tempfile.mkdtemp(), "attendance.db")
+os.chdir(os.path.dirname(os.path.abspath(__file__)))   # main mounts ./static
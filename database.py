@@ -1,10 +1,33 @@
-from sqlalchemy import create_engine
+import os
+from pathlib import Path
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./attendance.db"
+# Anchored to this file so the app finds its DB whatever directory it's started from.
+# ATTENDANCE_DB overrides it (the tests point it at a throwaway copy).
+DB_PATH = Path(os.environ.get("ATTENDANCE_DB") or Path(__file__).resolve().parent / "attendance.db").resolve()
+
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
+# Read-only URI on the same file, used by the heavy reporting endpoints.
+SQLALCHEMY_READ_DATABASE_URL = f"sqlite:///{DB_PATH.as_uri()}?mode=ro&uri=true"
+
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+read_engine = create_engine(SQLALCHEMY_READ_DATABASE_URL, connect_args={"check_same_thread": False})
+
+@event.listens_for(engine, "connect")
+def _set_wal(dbapi_conn, _):
+    # WAL lets readers keep working off a snapshot while a write commits,
+    # so a long report no longer blocks attendance submission (and vice versa).
+    dbapi_conn.execute("PRAGMA journal_mode=WAL")
+
+def checkpoint():
+    """Fold the WAL back into attendance.db so the file alone holds every write."""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 def get_db():
@@ -13,3 +36,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Columns added after their table first shipped: (table, column, DDL type)
+COLUMN_MIGRATIONS = [
+    ("attendance_sessions", "version",      "INTEGER DEFAULT 1"),
+    ("sync_batches",        "faculty_id",   "INTEGER"),
+    ("sync_batches",        "request_hash", "VARCHAR"),
+]
+
+def migrate(bind=engine):
+    """Bring an older database up to date — create_all never alters existing tables."""
+    with bind.begin() as conn:
+        for table, column, ddl in COLUMN_MIGRATIONS:
+            cols = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if cols and column not in cols:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_sessions_slot_date "
+                             "ON attendance_sessions (slot_id, date)")
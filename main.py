@@ -2,17 +2,26 @@ from fastapi import FastAPI, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-import hashlib, random
+import hashlib, json, random
 
 import models, database
-from database import engine, get_db
+from database import engine, get_db, get_read_db
 
 models.Base.metadata.create_all(bind=engine)
+database.migrate()
 
-app = FastAPI(title="Smart Attendance")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Fold the WAL back into attendance.db so the file is complete once stopped
+    database.checkpoint()
+
+app = FastAPI(title="Smart Attendance", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 def h(pw): return hashlib.sha256(pw.encode()).hexdigest()
@@ -102,11 +111,15 @@ def get_slots(faculty_id: Optional[int]=None, student_id: Optional[int]=None,
 # ══════════════════════════════════════════
 # ATTENDANCE
 # ══════════════════════════════════════════
+class AttendanceChange(BaseModel):
+    student_id: int
+    status: Literal["present","absent"]
+
 class AttendanceSubmit(BaseModel):
     slot_id: int
     faculty_id: int
     date: str
-    records: list   # [{student_id, status}]
+    records: List[AttendanceChange]
 
 @app.get("/api/attendance/slot-students/{slot_id}")
 def slot_students(slot_id: int, date: str, db: Session = Depends(get_db)):
@@ -137,7 +150,55 @@ def slot_students(slot_id: int, date: str, db: Session = Depends(get_db)):
 
     return {"students":students,"already_submitted":existing is not None,
             "total_present":existing.total_present if existing else 0,
-            "total_absent":existing.total_absent if existing else 0}
+            "total_absent":existing.total_absent if existing else 0,
+            "version":existing.version if existing else 0}
+
+def notify_absent(db: Session, stu: models.User, subj: Optional[models.Subject], date: str):
+    db.add(models.Notification(
+        user_id=stu.id,
+        title=f"Absent: {subj.name if subj else 'Class'}",
+        message=f"You were marked absent in {subj.name if subj else 'a class'} on {date}. "
+                f"Please maintain at least 75% attendance.",
+        type="warning"))
+    # Simulated parent alert — visible to admin
+    db.add(models.Notification(
+        role_target="admin",
+        title=f"Parent Alert — {stu.name}",
+        message=f"[SIMULATED] SMS/Email sent to parent of {stu.name} ({stu.student_id}): "
+                f"Absent in {subj.name if subj else 'class'} on {date}.",
+        type="warning"))
+
+def check_enrolled(db: Session, subject_id: int, student_ids):
+    enrolled = {e.student_id for e in db.query(models.Enrollment).filter(
+        models.Enrollment.subject_id==subject_id).all()}
+    unknown = sorted(set(student_ids) - enrolled)
+    if unknown:
+        raise HTTPException(400, f"Students not enrolled in this class: {unknown}")
+
+def apply_changes(db: Session, sess: models.AttendanceSession, final: dict):
+    """
+    Apply net {student_id: status} changes to a session, adjusting the totals
+    incrementally. Returns (applied count, students who became absent).
+    """
+    current = {r.student_id: r for r in sess.records}
+    applied, newly_absent = 0, []
+    for sid, status in final.items():
+        rec = current.get(sid)
+        if rec and rec.status == status: continue
+        if rec:
+            if rec.status == "present": sess.total_present -= 1
+            else: sess.total_absent -= 1
+            rec.status = status
+        else:
+            rec = models.AttendanceRecord(student_id=sid, status=status)
+            sess.records.append(rec); current[sid] = rec
+        if status == "present": sess.total_present += 1
+        else:
+            sess.total_absent += 1
+            stu = db.query(models.User).filter(models.User.id==sid).first()
+            if stu: newly_absent.append(stu)
+        applied += 1
+    return applied, newly_absent
 
 @app.post("/api/attendance/submit")
 def submit_attendance(req: AttendanceSubmit, db: Session = Depends(get_db)):
@@ -148,48 +209,151 @@ def submit_attendance(req: AttendanceSubmit, db: Session = Depends(get_db)):
         raise HTTPException(400, "Attendance already submitted for this session.")
 
     slot = db.query(models.ClassSlot).filter(models.ClassSlot.id==req.slot_id).first()
-    subj = db.query(models.Subject).filter(models.Subject.id==slot.subject_id).first() if slot else None
-
-    present_count = absent_count = 0
-    absent_students = []
+    if not slot: raise HTTPException(404, "Slot not found")
+    subj = slot.subject_rel
+    final = {r.student_id: r.status for r in req.records}
+    check_enrolled(db, slot.subject_id, final)
 
     sess = models.AttendanceSession(
-        subject_id=slot.subject_id if slot else None,
-        slot_id=req.slot_id, faculty_id=req.faculty_id, date=req.date)
-    db.add(sess); db.flush()
-
-    for rec in req.records:
-        sid, status = rec["student_id"], rec["status"]
-        db.add(models.AttendanceRecord(session_id=sess.id, student_id=sid, status=status))
-        if status == "present": present_count += 1
-        else:
-            absent_count += 1
-            stu = db.query(models.User).filter(models.User.id==sid).first()
-            if stu: absent_students.append(stu)
+        subject_id=slot.subject_id, slot_id=req.slot_id, faculty_id=req.faculty_id,
+        date=req.date, total_present=0, total_absent=0, version=1)
+    db.add(sess)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Lost a race with another submit for the same slot and date
+        db.rollback()
+        raise HTTPException(400, "Attendance already submitted for this session.")
 
-    sess.total_present = present_count
-    sess.total_absent  = absent_count
+    _, absent_students = apply_changes(db, sess, final)
     db.flush()
 
     # Notify absent students
     for stu in absent_students:
-        db.add(models.Notification(
-            user_id=stu.id,
-            title=f"Absent: {subj.name if subj else 'Class'}",
-            message=f"You were marked absent in {subj.name if subj else 'a class'} on {req.date}. "
-                    f"Please maintain at least 75% attendance.",
-            type="warning"))
-        # Simulated parent alert — visible to admin
-        db.add(models.Notification(
-            role_target="admin",
-            title=f"Parent Alert — {stu.name}",
-            message=f"[SIMULATED] SMS/Email sent to parent of {stu.name} ({stu.student_id}): "
-                    f"Absent in {subj.name if subj else 'class'} on {req.date}.",
-            type="warning"))
+        notify_absent(db, stu, subj, req.date)
+
+    db.commit()
+    return {"message":"Submitted","present":sess.total_present,
+            "absent":sess.total_absent,"alerts_sent":len(absent_students)}
+
+class SessionDelta(BaseModel):
+    slot_id: int
+    date: str
+    base_version: Optional[int] = None   # version the client read; 0 = not yet submitted
+    changes: List[AttendanceChange]      # only students whose status changed
+
+class AttendanceSync(BaseModel):
+    idempotency_key: str
+    faculty_id: int
+    sessions: List[SessionDelta]
+
+def stale_version(version: int):
+    return HTTPException(409, f"Session was changed by someone else (now version {version}). "
+                              f"Reload it and reapply your changes.")
+
+def sync_session(db: Session, faculty_id: int, d: SessionDelta):
+    """
+    Validate and apply one session delta. Everything is checked before the
+    session is touched, so a rejected delta leaves no partial writes.
+    """
+    slot = db.query(models.ClassSlot).filter(models.ClassSlot.id==d.slot_id).first()
+    if not slot: raise HTTPException(404, f"Slot {d.slot_id} not found")
+    if not slot.subject_rel or slot.subject_rel.faculty_id != faculty_id:
+        raise HTTPException(403, "This class is not assigned to you.")
+    # Later changes for the same student win — alerts follow the net result
+    final = {c.student_id: c.status for c in d.changes}
+    check_enrolled(db, slot.subject_id, final)
+
+    sess = db.query(models.AttendanceSession).filter(
+        models.AttendanceSession.slot_id==d.slot_id,
+        models.AttendanceSession.date==d.date).first()
+    version = sess.version if sess else 0
+    if sess and sess.faculty_id != faculty_id:
+        raise HTTPException(403, "This session was taken by another faculty member.")
+    if d.base_version is not None and d.base_version != version:
+        raise stale_version(version)
+
+    current = {r.student_id: r.status for r in sess.records} if sess else {}
+    result = {"slot_id":d.slot_id,"date":d.date,"session_id":sess.id if sess else None,
+              "version":version,"applied":0,"alerts_sent":0,
+              "total_present":sess.total_present if sess else 0,
+              "total_absent":sess.total_absent if sess else 0}
+    if all(current.get(sid)==status for sid, status in final.items()):
+        return result
+
+    if sess:
+        # Compare-and-swap: the totals below were computed from this version,
+        # so only write them if nobody has bumped it in the meantime.
+        swapped = db.query(models.AttendanceSession).filter(
+            models.AttendanceSession.id==sess.id,
+            models.AttendanceSession.version==version
+        ).update({"version": models.AttendanceSession.version + 1}, synchronize_session="evaluate")
+        if not swapped:
+            db.expire(sess)
+            raise stale_version(sess.version)
+        applied, absent_students = apply_changes(db, sess, final)
+    else:
+        sess = models.AttendanceSession(
+            subject_id=slot.subject_id, slot_id=d.slot_id, faculty_id=faculty_id,
+            date=d.date, total_present=0, total_absent=0, version=1)
+        db.add(sess); db.flush()
+        applied, absent_students = apply_changes(db, sess, final)
+    db.flush()
+    for stu in absent_students:
+        notify_absent(db, stu, slot.subject_rel, d.date)
+    result.update({"session_id":sess.id,"version":sess.version,"applied":applied,
+                   "alerts_sent":len(absent_students),
+                   "total_present":sess.total_present,"total_absent":sess.total_absent})
+    return result
+
+def sync_digest(req: AttendanceSync):
+    return hashlib.sha256(req.model_dump_json(exclude={"idempotency_key"}).encode()).hexdigest()
 
+def find_batch(db: Session, key: str):
+    return db.query(models.SyncBatch).filter(models.SyncBatch.idempotency_key==key).first()
+
+def replay_sync(done: models.SyncBatch, req: AttendanceSync, digest: str):
+    if done.faculty_id != req.faculty_id or done.request_hash != digest:
+        raise HTTPException(422, "This idempotency key was already used for a different request.")
+    return json.loads(done.response)
+
+@app.post("/api/attendance/sync")
+def sync_attendance(req: AttendanceSync, db: Session = Depends(get_db)):
+    """
+    Idempotent batched attendance marking. Creates or corrects any number of
+    sessions in one request; a replayed idempotency_key returns the stored
+    response without touching the data again. Each session is validated on
+    its own — a rejected one is reported with an error and the rest apply.
+    """
+    digest = sync_digest(req)
+    done = find_batch(db, req.idempotency_key)
+    if done: return replay_sync(done, req, digest)
+
+    # Claim the key before anything else. The INSERT takes SQLite's write lock,
+    # so the version checks and totals below run serialized against other writers.
+    batch = models.SyncBatch(idempotency_key=req.idempotency_key, faculty_id=req.faculty_id,
+                             request_hash=digest, response="{}")
+    db.add(batch)
+    try:
+        db.flush()
+    except IntegrityError:
+        # A concurrent retry of the same batch won the race — return its result.
+        db.rollback()
+        return replay_sync(find_batch(db, req.idempotency_key), req, digest)
+
+    results = []
+    for d in req.sessions:
+        try:
+            results.append(sync_session(db, req.faculty_id, d))
+        except HTTPException as e:
+            results.append({"slot_id":d.slot_id,"date":d.date,
+                            "error":e.detail,"status":e.status_code})
+
+    response = {"message":"Synced","sessions":results,
+                "alerts_sent":sum(r.get("alerts_sent",0) for r in results)}
+    batch.response = json.dumps(response)
     db.commit()
-    return {"message":"Submitted","present":present_count,
-            "absent":absent_count,"alerts_sent":len(absent_students)}
+    return response
 
 @app.get("/api/attendance/student/{student_id}")
 def student_attendance(student_id: int, db: Session = Depends(get_db)):
@@ -238,7 +402,7 @@ def faculty_attendance_history(faculty_id: int, db: Session = Depends(get_db)):
     return result
 
 @app.get("/api/attendance/admin/overview")
-def admin_overview(db: Session = Depends(get_db)):
+def admin_overview(db: Session = Depends(get_read_db)):
     sessions = db.query(models.AttendanceSession).all()
     records  = db.query(models.AttendanceRecord).all()
     total_present = sum(1 for r in records if r.status=="present")
@@ -296,7 +460,7 @@ def admin_overview(db: Session = Depends(get_db)):
 # AI — ABSENTEE PATTERN DETECTION
 # ══════════════════════════════════════════
 @app.get("/api/ai/patterns")
-def detect_patterns(db: Session = Depends(get_db)):
+def detect_patterns(db: Session = Depends(get_read_db)):
     """
     Detect students absent 3+ consecutive times in any subject.
     Pure logic — no external AI needed.
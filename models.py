@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -48,6 +48,7 @@ class Enrollment(Base):
 class AttendanceSession(Base):
     """One session = one class slot on one date, submitted by faculty."""
     __tablename__ = "attendance_sessions"
+    __table_args__ = (Index("uq_attendance_sessions_slot_date", "slot_id", "date", unique=True),)
     id            = Column(Integer, primary_key=True, index=True)
     subject_id    = Column(Integer, ForeignKey("subjects.id"))
     slot_id       = Column(Integer, ForeignKey("class_slots.id"))
@@ -55,6 +56,7 @@ class AttendanceSession(Base):
     date          = Column(String, nullable=False)   # YYYY-MM-DD
     total_present = Column(Integer, default=0)
     total_absent  = Column(Integer, default=0)
+    version       = Column(Integer, default=1)       # bumped on every applied change
     submitted_at  = Column(DateTime, default=datetime.utcnow)
     records       = relationship("AttendanceRecord", back_populates="session")
 
@@ -67,6 +69,16 @@ class AttendanceRecord(Base):
     session    = relationship("AttendanceSession", back_populates="records")
     student    = relationship("User", foreign_keys=[student_id])
 
+class SyncBatch(Base):
+    """Idempotency record — the stored response for one attendance sync batch."""
+    __tablename__ = "sync_batches"
+    id              = Column(Integer, primary_key=True)
+    idempotency_key = Column(String, unique=True, nullable=False, index=True)
+    faculty_id      = Column(Integer, ForeignKey("users.id"))
+    request_hash    = Column(String)                  # sha256 of the payload, minus the key
+    response        = Column(Text, nullable=False)    # JSON
+    created_at      = Column(DateTime, default=datetime.utcnow)
+
 class Notification(Base):
     __tablename__ = "notifications"
     id          = Column(Integer, primary_key=True)
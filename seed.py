@@ -1,10 +1,11 @@
 """Seed demo data — run automatically on first launch."""
 import hashlib, random
 from datetime import datetime, timedelta
-from database import SessionLocal, engine
+from database import SessionLocal, engine, migrate
 import models
 
 models.Base.metadata.create_all(bind=engine)
+migrate()
 
 COLORS = ["#3b82f6","#6366f1","#10b981","#f59e0b","#ef4444","#8b5cf6","#06b6d4","#ec4899"]
 
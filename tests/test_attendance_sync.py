@@ -0,0 +1,143 @@
+import sqlite3, threading, uuid
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import main, models, database, seed
+
+@pytest.fixture(scope="module")
+def client():
+    seed.seed()
+    with TestClient(main.app) as c:
+        yield c
+
+@pytest.fixture(scope="module")
+def slot(client):
+    sl = client.get("/api/slots").json()[0]
+    students = client.get(f"/api/attendance/slot-students/{sl['id']}?date=2000-01-01").json()["students"]
+    sl["students"] = [s["student_id"] for s in students]
+    return sl
+
+_dates = iter(f"2030-01-{d:02d}" for d in range(1, 32))
+
+@pytest.fixture
+def date():
+    return next(_dates)
+
+def sync(client, slot, sessions, key=None, faculty_id=None):
+    return client.post("/api/attendance/sync", json={
+        "idempotency_key": key or str(uuid.uuid4()),
+        "faculty_id": slot["faculty_id"] if faculty_id is None else faculty_id,
+        "sessions": sessions})
+
+def delta(slot, date, changes, base_version=None):
+    return {"slot_id": slot["id"], "date": date, "base_version": base_version,
+            "changes": [{"student_id": sid, "status": st} for sid, st in changes]}
+
+def stored(slot, date):
+    """(total_present, total_absent, version, present records, absent records) as stored."""
+    db = database.SessionLocal()
+    try:
+        s = db.query(models.AttendanceSession).filter(
+            models.AttendanceSession.slot_id==slot["id"],
+            models.AttendanceSession.date==date).first()
+        if not s: return None
+        statuses = [r.status for r in s.records]
+        return (s.total_present, s.total_absent, s.version,
+                statuses.count("present"), statuses.count("absent"))
+    finally:
+        db.close()
+
+def test_replayed_key_returns_stored_response(client, slot, date):
+    a, b = slot["students"][:2]
+    body = [delta(slot, date, [(a, "present"), (b, "absent")], base_version=0)]
+    first = sync(client, slot, body, key="replay-" + date).json()
+    again = sync(client, slot, body, key="replay-" + date).json()
+    assert again == first
+    assert stored(slot, date) == (1, 1, 1, 1, 1)
+
+def test_reused_key_with_different_request_is_rejected(client, slot, date):
+    a = slot["students"][0]
+    key = "reuse-" + date
+    assert sync(client, slot, [delta(slot, date, [(a, "present")])], key=key).status_code == 200
+    assert sync(client, slot, [delta(slot, date, [(a, "absent")])], key=key).status_code == 422
+    assert sync(client, slot, [delta(slot, date, [(a, "present")])], key=key,
+                faculty_id=999).status_code == 422
+
+def test_stale_base_version_conflicts(client, slot, date):
+    a = slot["students"][0]
+    assert sync(client, slot, [delta(slot, date, [(a, "present")], base_version=0)]).json()["sessions"][0]["version"] == 1
+    res = sync(client, slot, [delta(slot, date, [(a, "absent")], base_version=0)]).json()["sessions"][0]
+    assert res["status"] == 409
+    assert stored(slot, date) == (1, 0, 1, 1, 0)
+
+def test_changes_collapse_to_net_status(client, slot, date):
+    a, b = slot["students"][:2]
+    res = sync(client, slot, [delta(slot, date, [(a, "absent"), (a, "present"), (b, "present")])]).json()
+    assert res["alerts_sent"] == 0
+    assert res["sessions"][0]["applied"] == 2
+    assert stored(slot, date) == (2, 0, 1, 2, 0)
+
+def test_rejected_sessions_do_not_block_the_rest(client, slot, date):
+    a = slot["students"][0]
+    res = sync(client, slot, [
+        {"slot_id": 99999, "date": date, "changes": [{"student_id": a, "status": "absent"}]},
+        delta(slot, date, [(99999, "absent")]),
+        delta(slot, date, [(a, "absent")]),
+    ]).json()["sessions"]
+    assert [r.get("status") for r in res] == [404, 400, None]
+    assert stored(slot, date) == (0, 1, 1, 0, 1)
+
+def test_empty_delta_creates_no_session(client, slot, date):
+    res = sync(client, slot, [delta(slot, date, [])]).json()["sessions"][0]
+    assert res["session_id"] is None
+    assert stored(slot, date) is None
+
+def test_other_faculty_cannot_mark_the_class(client, slot, date):
+    a = slot["students"][0]
+    res = sync(client, slot, [delta(slot, date, [(a, "absent")])], faculty_id=999).json()
+    assert res["sessions"][0]["status"] == 403
+    assert stored(slot, date) is None
+
+def test_malformed_change_is_a_validation_error(client, slot, date):
+    body = [{"slot_id": slot["id"], "date": date, "changes": [{"student_id": slot["students"][0]}]}]
+    assert sync(client, slot, body).status_code == 422
+
+def test_concurrent_corrections_only_one_wins(client, slot, date):
+    students = slot["students"]
+    sync(client, slot, [delta(slot, date, [(s, "present") for s in students], base_version=0)])
+    barrier, results = threading.Barrier(2), []
+
+    def correct(sid):
+        body = [delta(slot, date, [(sid, "absent")], base_version=1)]
+        barrier.wait()
+        results.append(sync(TestClient(main.app), slot, body).json()["sessions"][0])
+
+    threads = [threading.Thread(target=correct, args=(sid,)) for sid in students[:2]]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert sorted(r.get("status", 200) for r in results) == [200, 409]
+    p, a, version, rec_p, rec_a = stored(slot, date)
+    assert (p, a, version) == (rec_p, rec_a, 2)
+    assert a == 1
+
+def test_migrate_upgrades_a_database_without_version(tmp_path):
+    path = tmp_path / "old.db"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE attendance_sessions (id INTEGER PRIMARY KEY, subject_id INTEGER, "
+                "slot_id INTEGER, faculty_id INTEGER, date VARCHAR NOT NULL, total_present INTEGER, "
+                "total_absent INTEGER, submitted_at DATETIME)")
+    con.execute("INSERT INTO attendance_sessions (slot_id, date, total_present, total_absent) "
+                "VALUES (1, '2024-01-01', 3, 1)")
+    con.commit(); con.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    database.migrate(engine)
+    database.migrate(engine)   # idempotent
+    engine.dispose()
+
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT version FROM attendance_sessions").fetchone() == (1,)
+    with pytest.raises(sqlite3.IntegrityError):
+        con.execute("INSERT INTO attendance_sessions (slot_id, date) VALUES (1, '2024-01-01')")